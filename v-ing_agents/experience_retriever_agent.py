@@ -1,22 +1,72 @@
+import asyncio
+import functools
+import logging
 import os
-from typing import Any, Dict, Optional, Tuple
+import sys
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
 
-from dotenv import load_dotenv
-from pydantic import BaseModel
-from agno.agent import Agent
-from agno.db.sqlite import SqliteDb
-from agno.models.openai import OpenAIChat
-from agno.tools import tool
+log = logging.getLogger(__name__)
 
-load_dotenv(".env")
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set")
+def _load_environment() -> None:
+    """Load .env and verify the API key; called on the paths that talk to OpenAI."""
 
+    from dotenv import load_dotenv
 
-class EventDetails(BaseModel):
-    """Structured details describing a single life experience."""
+    load_dotenv(".env")
+    if not os.getenv("OPENAI_API_KEY"):
+        raise ValueError("OPENAI_API_KEY is not set")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_coach_db():
+    """One shared store for every coach agent, created on first use.
+
+    The engine is pooled and the database runs in WAL mode so concurrent
+    sessions (see run_many) get parallel reads and a write path that does
+    not re-acquire file descriptors under load. SQLite keeps its WAL/SHM
+    files mapped and its page cache warm instead of reopening the db per
+    agent construction, and importers that only want EventDetails never
+    pay the agno import.
+    """
+
+    from agno.db.sqlite import SqliteDb
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.pool import QueuePool
+
+    # SqliteDb(db_file=...) would create the parent directory itself; with a
+    # pre-built engine we have to, or the first connection fails on a fresh
+    # checkout.
+    os.makedirs("tmp", exist_ok=True)
+
+    engine = create_engine(
+        "sqlite:///tmp/coach_sessions.db",
+        poolclass=QueuePool,
+        pool_size=5,
+        max_overflow=2,
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+    return SqliteDb(db_engine=engine)
+
+
+@dataclass(slots=True, frozen=True)
+class EventDetails:
+    """Structured details describing a single life experience.
+
+    A pure carrier built from fields the code already holds — never from
+    untrusted input — so a slotted dataclass replaces Pydantic validation
+    on the finalization path.
+    """
 
     event_id: int
     event_number: int
@@ -40,47 +90,40 @@ REQUIRED_EVENT_FIELDS = (
     "peak_moment",
 )
 
-CONFIRMATION_PHRASES = {
+_REQUIRED_SET = frozenset(REQUIRED_EVENT_FIELDS)
+
+def _present_fields(current_event: Dict[str, Any]) -> set:
+    return {key for key, value in current_event.items() if value and str(value).strip()}
+
+# Base phrases only; trailing punctuation is stripped from the input before lookup.
+_TRAILING_PUNCTUATION = "!.?, "
+
+CONFIRMATION_PHRASES = frozenset({
     "yes",
-    "yes.",
-    "yes!",
     "yes, that's right",
     "yes that's right",
     "yes, correct",
     "correct",
-    "correct.",
-    "correct!",
     "that's correct",
     "that's right",
     "that is correct",
     "looks good",
-    "looks good.",
     "looks good to me",
     "sounds good",
-    "sounds good.",
     "sounds right",
     "all good",
-    "all good.",
     "perfect",
-    "perfect.",
     "confirmed",
-    "confirmed.",
     "absolutely",
-    "absolutely.",
-}
+})
 
 
 def _is_confirmation_phrase(text: str) -> bool:
-    return text.strip().lower() in CONFIRMATION_PHRASES
+    return text.strip().rstrip(_TRAILING_PUNCTUATION).lower() in CONFIRMATION_PHRASES
 
 
 def _all_required_fields_present(session_state: Dict[str, Any]) -> bool:
-    current_event = session_state.get("current_event", {})
-    for field in REQUIRED_EVENT_FIELDS:
-        value = current_event.get(field)
-        if not value or not str(value).strip():
-            return False
-    return True
+    return _REQUIRED_SET.issubset(_present_fields(session_state.get("current_event", {})))
 
 
 def _ensure_event_container(session_state: Dict[str, Any]) -> Dict[str, Any]:
@@ -89,7 +132,6 @@ def _ensure_event_container(session_state: Dict[str, Any]) -> Dict[str, Any]:
     return session_state["current_event"]
 
 
-@tool
 def update_single_field(session_state: Dict[str, Any], field_name: str, field_value: str) -> str:
     """Store a single field gathered from the user."""
 
@@ -110,25 +152,24 @@ def update_single_field(session_state: Dict[str, Any], field_name: str, field_va
     return f"Stored {field_name}."
 
 
-@tool
 def update_multiple_fields(session_state: Dict[str, Any], updates: Dict[str, str]) -> str:
     """Store multiple experience fields at once."""
 
-    current_event = _ensure_event_container(session_state)
-    applied: Dict[str, str] = {}
-
-    for field, value in updates.items():
-        if field in REQUIRED_EVENT_FIELDS and value and value.strip():
-            current_event[field] = value.strip()
-            applied[field] = value.strip()
-
+    # Per-entry filtering: an unknown key or non-string value from the model
+    # drops only that entry, never the valid fields alongside it. Frozenset
+    # membership keeps the field check a single hash lookup.
+    applied = {
+        field: value.strip()
+        for field, value in (updates or {}).items()
+        if field in _REQUIRED_SET and isinstance(value, str) and value.strip()
+    }
     if not applied:
-        return "No valid fields provided."
+        return "No valid fields provided. Use only these fields: " + ", ".join(REQUIRED_EVENT_FIELDS)
 
+    _ensure_event_container(session_state).update(applied)
     return "Stored fields: " + ", ".join(sorted(applied.keys()))
 
 
-@tool
 def confirm_data_from_user(session_state: Dict[str, Any]) -> Dict[str, Any]:
     """Present the collected data back to the user for confirmation."""
 
@@ -144,15 +185,11 @@ def confirm_data_from_user(session_state: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-@tool
 def confirm_completeness(session_state: Dict[str, Any]) -> Dict[str, Any]:
     """Mark the experience complete when all fields are captured."""
 
     current_event = session_state.get("current_event", {})
-    missing_fields = [
-        field for field in REQUIRED_EVENT_FIELDS
-        if not current_event.get(field)
-    ]
+    missing_fields = sorted(_REQUIRED_SET - _present_fields(current_event))
 
     if missing_fields:
         return {
@@ -161,18 +198,19 @@ def confirm_completeness(session_state: Dict[str, Any]) -> Dict[str, Any]:
             "message": "Still need: " + ", ".join(missing_fields),
         }
 
-    event_details = _finalize_completed_event(session_state)
+    _, dumped_event = _finalize_completed_event(session_state)
 
     return {
         "status": "complete",
         "message": "All experience details are confirmed and complete.",
-        "event_details": event_details.model_dump(),
+        "event_details": dumped_event,
     }
 
 
-def _finalize_completed_event(session_state: Dict[str, Any]) -> EventDetails:
+def _finalize_completed_event(session_state: Dict[str, Any]) -> Tuple[EventDetails, Dict[str, Any]]:
     experience_no = session_state.get("experience_no", 1)
     event_phase = session_state.get("stage") or f"experience_{experience_no}"
+    current_event = session_state.get("current_event") or {}
 
     event_details = EventDetails(
         event_id=experience_no,
@@ -183,22 +221,23 @@ def _finalize_completed_event(session_state: Dict[str, Any]) -> EventDetails:
         current_occupation=session_state.get("current_occupation"),
         desired_career=session_state.get("desired_career"),
         work_experience=session_state.get("work_experience"),
-        event_overview=session_state.get("current_event", {}).get("event_overview"),
-        when_happened=session_state.get("current_event", {}).get("when_happened"),
-        what_happened=session_state.get("current_event", {}).get("what_happened"),
-        peak_moment=session_state.get("current_event", {}).get("peak_moment"),
+        event_overview=current_event.get("event_overview"),
+        when_happened=current_event.get("when_happened"),
+        what_happened=current_event.get("what_happened"),
+        peak_moment=current_event.get("peak_moment"),
         is_complete=True,
     )
 
-    session_state["completed_event"] = event_details.model_dump()
+    # Dump once; the same dict is stored in session state and handed back to
+    # callers so the fields aren't re-serialized a second time.
+    dumped_event = asdict(event_details)
+    session_state["completed_event"] = dumped_event
     session_state["session_complete"] = True
-    return event_details
+    return event_details, dumped_event
 
 
-def _build_instruction_block(profile_data: Dict[str, Any]) -> Tuple[str, ...]:
-    experience_no = profile_data.get("experience_no", "Not provided")
-    stage = profile_data.get("stage", "Not provided")
-
+@functools.lru_cache(maxsize=32)
+def _build_instruction_block(experience_no: Any, stage: Any) -> Tuple[str, ...]:
     return (
         "ROLE: You are an empathetic experience coach helping the user capture one meaningful life event.",
         "PROFILE CONTEXT:",
@@ -216,30 +255,60 @@ def _build_instruction_block(profile_data: Dict[str, Any]) -> Tuple[str, ...]:
     )
 
 
-def create_experience_coach(profile_data: Dict[str, Any]) -> Agent:
-    instruction_block = list(_build_instruction_block(profile_data))
+@functools.lru_cache(maxsize=1)
+def _coach_tools() -> Tuple[Any, ...]:
+    """Wrap the tool functions once; schema reflection happens on first use."""
+
+    from agno.tools import tool
+
+    return (
+        tool(update_single_field),
+        tool(update_multiple_fields),
+        tool(confirm_data_from_user),
+        tool(confirm_completeness),
+    )
+
+
+def create_experience_coach(profile_data: Dict[str, Any]):
+    from agno.agent import Agent
+    from agno.models.openai import OpenAIChat
+
+    # agno only accepts str or list instructions; a bare tuple is silently
+    # ignored, so wrap the cached tuple in a fresh list.
+    instruction_block = list(_build_instruction_block(
+        profile_data.get("experience_no", "Not provided"),
+        profile_data.get("stage", "Not provided"),
+    ))
 
     return Agent(
+        # agno already requests stream usage (include_usage) on its streaming
+        # calls, so token counts arrive on the run events without extra config.
         model=OpenAIChat(id="gpt-4o-mini"),
         description="Empathetic coach that gathers structured experience details through conversation.",
-        db=SqliteDb(db_file="tmp/coach_sessions.db"),
+        db=_get_coach_db(),
         enable_user_memories=True,
-        add_history_to_context=True,
+        # History is passed explicitly as an append-only transcript (see
+        # _run_session_async) so the prompt prefix stays byte-identical
+        # across turns and the server-side prefix cache can hit.
+        add_history_to_context=False,
         add_session_state_to_context=True,
-        tools=[update_single_field, update_multiple_fields, confirm_data_from_user, confirm_completeness],
+        tools=list(_coach_tools()),
         instructions=instruction_block,
         markdown=True,
     )
 
 
 def _initial_session_state(profile_data: Dict[str, Any]) -> Dict[str, Any]:
-    base_state = dict(profile_data)
-    base_state.setdefault("experience_no", 1)
-    base_state.setdefault("stage", f"experience_{base_state['experience_no']}")
-    base_state.setdefault("current_event", {})
-    base_state.setdefault("session_complete", False)
-    base_state["profile_data"] = dict(profile_data)
-    return base_state
+    experience_no = profile_data.get("experience_no", 1)
+    return {
+        **profile_data,
+        "experience_no": experience_no,
+        "stage": profile_data.get("stage") or f"experience_{experience_no}",
+        "current_event": profile_data.get("current_event") or {},
+        "session_complete": False,
+        # Stored by reference; profile_data is read-only downstream.
+        "profile_data": profile_data,
+    }
 
 
 def _print_event_summary(event_details: EventDetails) -> None:
@@ -253,30 +322,58 @@ def _print_event_summary(event_details: EventDetails) -> None:
     print("==========================")
 
 
-def run_experience_session(
+async def _run_session_async(
     profile_data: Dict[str, Any],
     user_id: Optional[str] = None,
     session_id: Optional[str] = None,
+    input_fn: Optional[Any] = None,
 ) -> Optional[EventDetails]:
-    """Run the conversational experience retriever session."""
+    """Async core of the experience session.
+
+    A single Agent (and therefore a single underlying OpenAI client with a
+    kept-alive HTTP connection) serves every turn, so TLS/TCP setup is paid
+    once per session instead of once per turn.
+    """
 
     if not profile_data.get("name"):
         raise ValueError("profile_data must include the user's name.")
 
     agent = create_experience_coach(profile_data)
 
-    session_id = session_id or f"experience_session_{profile_data.get('experience_no', 1)}"
     agent.user_id = user_id or f"{profile_data['name'].lower().replace(' ', '_')}_user"
+    # The session id must be unique per profile: run_many drives sessions
+    # concurrently, and backfill profiles typically share experience_no, so
+    # an id derived from that alone would make them all merge into one
+    # session row and cross-contaminate each other's state.
+    agent.session_id = session_id or (
+        f"{agent.user_id}_experience_{profile_data.get('experience_no', 1)}"
+    )
     agent.session_state = _initial_session_state(profile_data)
 
     print("=== Experience Retrieval Session ===")
     print("Coach: Thank you for being here. When you're ready, please walk me through a meaningful life experience that has stayed with you.")
 
+    if input_fn is None:
+        # Imported here so the interactive-only dependency doesn't tax module import.
+        from prompt_toolkit import PromptSession
+
+        prompt_session = PromptSession()
+
+        def input_fn():
+            # prompt_async keeps the event loop free while the user types, so
+            # connection keepalive and pending agent work overlap with typing
+            # instead of waiting behind a blocked stdin read.
+            return prompt_session.prompt_async("\nYou: ")
+
     first_turn = True
+    # Append-only transcript with stable keys and no per-turn noise
+    # (timestamps, ids), so each request shares the previous one as an
+    # exact byte prefix.
+    transcript: List[Dict[str, str]] = []
 
     while True:
         try:
-            user_message = input("\nYou: ")
+            user_message = await input_fn()
         except EOFError:
             print("\nCoach: The session ended unexpectedly. Let's continue another time.")
             return None
@@ -289,16 +386,62 @@ def run_experience_session(
             print("\nCoach: Thank you for sharing with me today. We can pick this up any time.")
             return None
 
-        run_kwargs = {"user_id": agent.user_id, "session_id": agent.session_id, "stream": False}
+        # The final "yes" is decidable locally: when every required field is
+        # already captured, finalize here and skip an entire LLM round-trip
+        # on the most latency-sensitive turn of the session. Before the first
+        # run no session row exists yet and get_session_state() raises, so
+        # the first turn reads the initial state assigned above instead.
+        state = (agent.session_state if first_turn else agent.get_session_state()) or {}
+        if _is_confirmation_phrase(user_message) and _all_required_fields_present(state):
+            event_details, _ = _finalize_completed_event(state)
+            print("\nCoach: All experience details are confirmed and complete.")
+            _print_event_summary(event_details)
+            return event_details
+
+        run_kwargs = {
+            "user_id": agent.user_id,
+            "session_id": agent.session_id,
+            "stream": True,
+            # Surface events while tools are still executing so reply tokens
+            # start printing during the tool chain instead of after it.
+            "stream_intermediate_steps": True,
+        }
         if first_turn:
             run_kwargs["session_state"] = agent.session_state
             first_turn = False
 
-        response = agent.run(user_message, **run_kwargs)
-        reply_text = getattr(response, "content", str(response))
+        transcript.append({"role": "user", "content": user_message})
+
+        sys.stdout.write("\nCoach: ")
+        reply_parts = []
+        # Token counts arrive on the run events themselves (agno requests
+        # stream usage), so cost tracking needs no second request and no
+        # re-tokenization of the transcript.
+        turn_metrics = None
+        async for chunk in agent.arun(transcript, **run_kwargs):
+            metrics = getattr(chunk, "metrics", None)
+            if metrics is not None:
+                turn_metrics = metrics
+            # Only content deltas belong in the transcript: tool events carry
+            # their result payload as content, and the terminal RunCompleted
+            # event repeats the whole accumulated reply.
+            if getattr(chunk, "event", None) != "RunContent":
+                continue
+            content = getattr(chunk, "content", None)
+            if content and isinstance(content, str):
+                sys.stdout.write(content)
+                sys.stdout.flush()
+                reply_parts.append(content)
+        sys.stdout.write("\n")
+        if turn_metrics is not None:
+            log.debug("Session %s turn token usage: %s", agent.session_id, turn_metrics)
+        reply_text = "".join(reply_parts)
         if reply_text:
-            print(f"\nCoach: {reply_text.strip()}")
+            transcript.append({"role": "assistant", "content": reply_text})
 
+        # get_session_state() returns the dict the tools actually mutated;
+        # agent.session_state is only the constructor-time snapshot and goes
+        # stale from turn 2 onward while sessions aren't cached in memory.
         session_state = agent.get_session_state() or {}
 
         if session_state.get("session_complete"):
@@ -312,12 +455,161 @@ def run_experience_session(
             return None
 
         if _is_confirmation_phrase(user_message) and _all_required_fields_present(session_state):
-            event_details = _finalize_completed_event(session_state)
+            event_details, _ = _finalize_completed_event(session_state)
             print("\nCoach: All experience details are confirmed and complete.")
             _print_event_summary(event_details)
             return event_details
 
 
+def run_experience_session(
+    profile_data: Dict[str, Any],
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+) -> Optional[EventDetails]:
+    """Run the conversational experience retriever session."""
+
+    _load_environment()
+    return asyncio.run(_run_session_async(profile_data, user_id=user_id, session_id=session_id))
+
+
+async def run_many(
+    profiles: List[Dict[str, Any]],
+    concurrency: int = 16,
+    input_fn: Optional[Any] = None,
+) -> List[Optional[EventDetails]]:
+    """Run many experience sessions concurrently for backfill/eval workloads.
+
+    Sequential sessions leave the rate-limit budget idle while one request
+    generates; a semaphore-bounded gather keeps up to ``concurrency``
+    sessions in flight at once. Pass a scripted async ``input_fn`` so the
+    sessions don't contend for the interactive prompt.
+    """
+
+    _load_environment()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _bounded(profile: Dict[str, Any]) -> Optional[EventDetails]:
+        async with semaphore:
+            return await _run_session_async(profile, input_fn=input_fn)
+
+    return list(await asyncio.gather(*(_bounded(profile) for profile in profiles)))
+
+
+_BATCH_MODEL = "gpt-4o-mini"
+_BATCH_SYSTEM_PROMPT = (
+    "You summarize a captured life experience in 2-3 sentences and suggest up to "
+    "three short topic tags. Reply as JSON with keys 'summary' and 'tags'."
+)
+
+
+def _load_session_events(session_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Read the completed event stored for each session from coach_sessions.db."""
+
+    import json
+    import sqlite3
+
+    events: Dict[str, Dict[str, Any]] = {}
+    # On a checkout where no session has ever run there is nothing to read;
+    # connecting anyway would create an empty db file and then fail on the
+    # missing agno_sessions table.
+    db_path = "tmp/coach_sessions.db"
+    if not os.path.exists(db_path):
+        return events
+
+    conn = sqlite3.connect(db_path)
+    try:
+        for session_id in session_ids:
+            row = conn.execute(
+                "SELECT session_data FROM agno_sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if not row or not row[0]:
+                continue
+            session_data = json.loads(row[0])
+            completed_event = (session_data.get("session_state") or {}).get("completed_event")
+            if completed_event:
+                events[session_id] = completed_event
+    except sqlite3.OperationalError:
+        # The db exists but agno hasn't created its tables yet.
+        return {}
+    finally:
+        conn.close()
+    return events
+
+
+def batch_reprocess_sessions(
+    session_ids: List[str],
+    poll_interval: float = 30.0,
+) -> Dict[str, Any]:
+    """Re-process completed sessions offline through the OpenAI Batch API.
+
+    Non-interactive enrichment (summaries, tagging) does not need the
+    streaming path: batching the requests into one JSONL upload runs at up
+    to half the synchronous price and puts no pressure on RPM/TPM limits.
+    Returns a mapping of session_id to the parsed enrichment reply.
+    """
+
+    import json
+    import tempfile
+    import time
+
+    from openai import OpenAI
+
+    _load_environment()
+    events = _load_session_events(session_ids)
+    if not events:
+        return {}
+
+    client = OpenAI()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as handle:
+        for session_id, completed_event in events.items():
+            handle.write(json.dumps({
+                "custom_id": session_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": _BATCH_MODEL,
+                    "messages": [
+                        {"role": "system", "content": _BATCH_SYSTEM_PROMPT},
+                        {"role": "user", "content": json.dumps(completed_event)},
+                    ],
+                },
+            }) + "\n")
+        batch_input_path = handle.name
+
+    try:
+        with open(batch_input_path, "rb") as batch_file:
+            uploaded = client.files.create(file=batch_file, purpose="batch")
+    finally:
+        # The JSONL only exists to be uploaded; drop it win or lose.
+        os.unlink(batch_input_path)
+
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+
+    while batch.status not in {"completed", "failed", "expired", "cancelled"}:
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch.id} finished with status {batch.status}")
+
+    results: Dict[str, Any] = {}
+    output = client.files.content(batch.output_file_id)
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        body = (record.get("response") or {}).get("body") or {}
+        choices = body.get("choices") or []
+        if choices:
+            results[record["custom_id"]] = choices[0]["message"]["content"]
+    return results
+
 
 def _sample_profile() -> Dict[str, Any]:
     return {
@@ -1,21 +1,33 @@
+import functools
+import logging
 import os
-from dotenv import load_dotenv
+import re
+import sys
+import threading
+from collections import OrderedDict
+from typing import Optional
 
-load_dotenv(".env")
+try:
+    # Line editing + history for the input() prompt; not available everywhere.
+    import readline  # noqa: F401
+except ImportError:
+    pass
+from pydantic import BaseModel, Field
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Debug output goes through logging so the dict formatting is skipped
+# entirely unless someone opts in with LOG_LEVEL=DEBUG.
+log = logging.getLogger(__name__)
 
-print(OPENAI_API_KEY)
 
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set")
+def _load_environment() -> None:
+    """Load .env and verify the API key; called when a session starts."""
+
+    from dotenv import load_dotenv
+
+    load_dotenv(".env")
+    if not os.getenv("OPENAI_API_KEY"):
+        raise ValueError("OPENAI_API_KEY is not set")
 
-from typing import Optional
-from pydantic import BaseModel, Field
-from agno.agent import Agent
-from agno.models.openai import OpenAIChat
-from agno.db.sqlite import SqliteDb
-from copy import deepcopy
 
 profile_data_to_store_to_db = {}
 
@@ -29,24 +41,97 @@ class UserProfile(BaseModel):
     work_experience: Optional[str] = None
 
 
-# Create database for session persistence
-db = SqliteDb(db_file="tmp/self_analysis_coach.db")
+# Field names and an empty-profile template, built once so session starts
+# don't pay pydantic model construction + dump just to get a blank dict.
+_PROFILE_FIELDS = tuple(UserProfile.model_fields.keys())
+_EMPTY_PROFILE_TEMPLATE = dict.fromkeys(_PROFILE_FIELDS, None)
+
+# Display label per profile field for the end-of-session summary.
+_PROFILE_DISPLAY = (
+    ('Name', 'name'),
+    ('Age', 'age'),
+    ('Current Occupation', 'current_occupation'),
+    ('Desired Career', 'desired_career'),
+    ('Work Experience', 'work_experience'),
+)
+
+@functools.lru_cache(maxsize=1)
+def _get_db():
+    """Database for session persistence, created once on first use.
+
+    WAL mode plus a relaxed sync level means each session-state flush is no
+    longer a full fsync under the default rollback journal, and concurrent
+    sessions stop serializing reads. Building it lazily keeps the agno and
+    sqlalchemy imports off the module-import path.
+    """
+
+    from agno.db.sqlite import SqliteDb
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.pool import QueuePool
+
+    # SqliteDb(db_file=...) would create the parent directory itself; with a
+    # pre-built engine we have to, or the first connection fails on a fresh
+    # checkout.
+    os.makedirs("tmp", exist_ok=True)
+
+    # WAL gives one writer plus parallel readers; size the pool for the
+    # readers and keep writes serialized at the app layer (_write_lock) so
+    # concurrent sessions queue before SQLite's lock instead of holding
+    # connections while they wait.
+    engine = create_engine(
+        "sqlite:///tmp/self_analysis_coach.db",
+        poolclass=QueuePool,
+        pool_size=os.cpu_count() or 4,
+        max_overflow=2,
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.execute("PRAGMA temp_store=memory")
+        cursor.execute("PRAGMA cache_size=-20000")
+        cursor.close()
+
+    return SqliteDb(db_engine=engine)
+
+# In-process profile memory to prevent loss across tool calls/turns.
+# The agent runs a single fixed session id per process, so one dict is the
+# honest representation; it is cleared when the session loop ends so a
+# long-running process doesn't accumulate stale fields.
+profile_memory: dict = {}
+# Serializes profile writes across concurrent sessions before they reach
+# SQLite's internal lock.
+_write_lock = threading.Lock()
+_DEFAULT_SESSION_ID = "coaching_session"
+_USER_PROMPT = "\n👤 You: "
+
+# Replies keyed by (session, normalized input, profile snapshot): verbatim
+# repeats against an unchanged profile skip the model round-trip entirely.
+# A changed profile changes the key, so stale replies are never served.
+_reply_cache: OrderedDict = OrderedDict()
+_REPLY_CACHE_CAP = 128
+
+
+def _is_set(value) -> bool:
+    """One definition of "has a value" shared by every merge/persist path."""
+    return value is not None and value != ""
 
-# In-process profile memory to prevent loss across tool calls/turns
-# This accumulates fields and is merged with the agent's session_state each update.
-profile_memory = UserProfile().model_dump()
 
 def _merge_profile(session_state: dict) -> dict:
     """
     Merge the in-process memory with the session state's user_profile.
     Non-None and non-empty values from session_state take precedence.
     """
-    merged = deepcopy(profile_memory)
+    # The memory is a flat dict of scalars (str/int/None); the | merge does
+    # the copy-and-overlay in one C-level pass instead of a Python loop.
     in_state = (session_state or {}).get("user_profile", {}) or {}
-    for k, v in in_state.items():
-        if v is not None and v != "":
-            merged[k] = v
-    return merged
+    return _EMPTY_PROFILE_TEMPLATE | profile_memory | {
+        k: v for k, v in in_state.items() if _is_set(v)
+    }
 
 
 def _persist_memory(profile: dict) -> None:
@@ -54,73 +139,176 @@ def _persist_memory(profile: dict) -> None:
     Persist non-empty values into the in-process memory.
     """
     for k, v in (profile or {}).items():
-        if v is not None and v != "":
+        if _is_set(v):
             profile_memory[k] = v
 
 
+_AGE_RE = re.compile(r"\d+")
+_MAX_PLAUSIBLE_AGE = 130
+
+
+def _coerce_age(value):
+    """Pull the first number out of inputs like '25' or 'around 25 years'.
+
+    Values with no number or an implausible one (e.g. a year like '1990')
+    are returned unchanged rather than silently stored wrong.
+    """
+    match = _AGE_RE.search(str(value))
+    if not match:
+        return value
+    age = int(match.group())
+    return age if 0 < age <= _MAX_PLAUSIBLE_AGE else value
+
+
 def update_profile(session_state, field: str, value: str) -> str:
     """Update a specific field in the user profile, merging with existing state."""
+    # Empty tool calls are a common LLM artifact; skip the merge + store write.
+    if not _is_set(value):
+        return f"Skipped empty update for {field}."
     # Coerce age to int when possible
     if field == "age":
-        try:
-            value = int(str(value).strip().split()[0])
-        except Exception:
-            pass
+        value = _coerce_age(value)
     # Merge with memory so previously captured fields aren’t lost
-    profile = _merge_profile(session_state)
-    profile[field] = value
-    session_state["user_profile"] = profile
-    _persist_memory(profile)
-    print(f"DEBUG: Updated {field} = {value}")
-    print(f"DEBUG: Current profile (merged): {session_state['user_profile']}")
+    with _write_lock:
+        profile = _merge_profile(session_state)
+        profile[field] = value
+        session_state["user_profile"] = profile
+        _persist_memory(profile)
+    log.debug("Updated %s = %s", field, value)
+    log.debug("Current profile (merged): %s", profile)
     return f"Updated {field}: {value}"
 
 
 def update_multiple_fields(session_state, updates: dict) -> str:
     """Update multiple fields at once, merging with existing state."""
-    profile = _merge_profile(session_state)
+    # Empty tool calls are a common LLM artifact; skip the merge + store write.
+    if not any(_is_set(v) for v in (updates or {}).values()):
+        return "No fields to update."
+    # Buffer every field into a local dict and touch session_state exactly
+    # once at the end: the session store then commits one write for the whole
+    # batch instead of one per field.
+    staged = {}
     for field, value in (updates or {}).items():
-        if value is None or value == "":
+        if not _is_set(value):
             continue
         if field == "age":
-            try:
-                value = int(str(value).strip().split()[0])
-            except Exception:
-                pass
-        profile[field] = value
-    session_state["user_profile"] = profile
-    _persist_memory(profile)
-    print(f"DEBUG: Updated multiple fields: {updates}")
-    print(f"DEBUG: Current profile (merged): {session_state['user_profile']}")
+            value = _coerce_age(value)
+        staged[field] = value
+    with _write_lock:
+        profile = _merge_profile(session_state)
+        profile.update(staged)
+        session_state["user_profile"] = profile
+        _persist_memory(profile)
+    log.debug("Updated multiple fields: %s", updates)
+    log.debug("Current profile (merged): %s", profile)
     return f"Updated multiple fields: {list(updates.keys())}"
 
 
 def confirm_profile(session_state) -> str:
     """Mark profile as confirmed"""
+    profile = session_state.get('user_profile')
     session_state['profile_confirmed'] = True
-    print(f"DEBUG: Profile confirmed. Final state: {session_state['user_profile']}")
+    log.debug("Profile confirmed. Final state: %s", profile)
     return "Profile confirmed!"
 
 
 def check_profile_completeness(session_state) -> str:
     """Check which fields are still missing"""
     profile = session_state['user_profile']
-    missing_fields = []
-
-    if not profile.get('name'):
-        missing_fields.append('name')
-    if not profile.get('age'):
-        missing_fields.append('age')
-    if not profile.get('current_occupation'):
-        missing_fields.append('current_occupation')
-    if not profile.get('desired_career'):
-        missing_fields.append('desired_career')
-    if not profile.get('work_experience'):
-        missing_fields.append('work_experience')
-
+    missing_fields = [field for field in _PROFILE_FIELDS if not profile.get(field)]
     return f"Missing fields: {missing_fields}" if missing_fields else "Profile is complete"
 
 
+# The full system prompt, hoisted to one module-level tuple: it is fully
+# static (no per-session interpolation), so it is allocated once at import
+# and every session reuses the same interned strings.
+_COACH_INSTRUCTIONS = (
+    "You are a personal Self Analysis Coach helping users explore their career path.",
+    "",
+    "GOAL: Collect these 5 pieces of information:",
+    "1. Name",
+    "2. Age",
+    "3. Current occupation or student status",
+    "4. Desired career path",
+    "5. Work experience or part-time job history",
+    "",
+    # Interpolating profile values here would change the prompt prefix
+    # as soon as a field is learned and defeat the prompt cache; the
+    # live values ride along in session_state instead.
+    "CURRENT PROFILE STATUS: see user_profile in the session state below.",
+    "",
+    "IMPORTANT CONVERSATION RULES:",
+    "",
+    "1. HANDLING MULTIPLE DATA AT ONCE:",
+    "   - If user provides multiple pieces of information in one response, extract ALL relevant data",
+    "   - Use update_multiple_fields tool to update several fields at once",
+    "   - Make ONE update_multiple_fields call with every field; never a series of update_profile calls",
+    "   - Example: 'I'm John, 25, working as a developer' → update name, age, and occupation",
+    "",
+    "2. HANDLING VAGUE ANSWERS:",
+    "   - If answer is too vague, ask specific follow-up questions",
+    "   - Examples of vague answers: 'I work', 'I'm in tech', 'I study'",
+    "   - Ask for specifics: 'What's your specific role?', 'Which field of tech?', 'What do you study?'",
+    "",
+    "3. WORK EXPERIENCE HANDLING:",
+    "   - If user mentions current job, also ask about work experience duration",
+    "   - If they say 'working for 3 years', update both current_occupation AND work_experience",
+    "",
+    "4. CONFIRMATION PROCESS:",
+    "   - Use check_profile_completeness to see what's missing",
+    "   - Only use confirm_profile when ALL 5 fields are filled",
+    "   - Always show a summary before confirming",
+    "",
+    "5. GREETING BEHAVIOR:",
+    "   - If name provided: greet by name",
+    "   - If no name: ask for name first",
+    "   - Be warm and encouraging throughout",
+    "",
+    "EXAMPLE CONVERSATION FLOWS:",
+    "",
+    "User: 'Hi, I'm Sarah, 28, working as a software engineer for 5 years, want to become a tech lead'",
+    "→ Extract: name=Sarah, age=28, current_occupation=software engineer, work_experience=5 years, desired_career=tech lead",
+    "→ Use update_multiple_fields with all data",
+    "→ Confirm all information is correct",
+    "",
+    "User: 'I work in tech'",
+    "→ Too vague! Ask: 'What's your specific role in tech? Are you a developer, designer, analyst, etc.?'",
+    "",
+    "Always use the tools to update the session state as you collect information!"
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _build_agent():
+    """Construct the Self Analysis Coach agent once.
+
+    Everything passed here is static across sessions, so the tool-schema
+    reflection and model setup happen a single time; each session only
+    resets agent.session_state.
+    """
+
+    from agno.agent import Agent
+    from agno.models.openai import OpenAIChat
+
+    return Agent(
+        name="Self Analysis Coach",
+        # agno requests stream usage itself; cached_tokens for verifying
+        # prefix-cache hits on turn 2+ shows up in the run's metrics.
+        model=OpenAIChat(id="gpt-4o-mini"),
+        db=_get_db(),
+        # Stable ids: the provider's prompt cache keys on the request prefix,
+        # so nothing per-turn may leak into the system message or routing.
+        user_id="self_analysis_user",
+        session_id="coaching_session",
+        add_history_to_context=True,
+        add_session_state_to_context=True,
+        enable_agentic_state=True,
+        tools=[update_profile, update_multiple_fields, confirm_profile, check_profile_completeness],
+        instructions=list(_COACH_INSTRUCTIONS),
+        markdown=True
+    )
+
+
 def run_coaching_session(name: Optional[str] = None, age: Optional[int] = None):
     """
     Run the coaching session with optional name and age parameters
@@ -130,88 +318,25 @@ def run_coaching_session(name: Optional[str] = None, age: Optional[int] = None):
         age: User's age (if already known)
     """
 
+    _load_environment()
+
     # Initialize user profile with provided data
-    initial_profile = UserProfile().model_dump()
+    initial_profile = _EMPTY_PROFILE_TEMPLATE.copy()
     if name:
         initial_profile['name'] = name
     if age:
         initial_profile['age'] = age
 
-    print(f"DEBUG: Initial profile: {initial_profile}")
+    log.debug("Initial profile: %s", initial_profile)
     # Seed in-process memory with any provided initial values
     _persist_memory(initial_profile)
 
-    # Create the Self Analysis Coach agent
-    coach_agent = Agent(
-        name="Self Analysis Coach",
-        model=OpenAIChat(id="gpt-4o-mini"),
-        db=db,
-        session_id="coaching_session",
-        add_history_to_context=True,
-        session_state={
-            "user_profile": initial_profile,
-            "profile_confirmed": False
-        },
-        add_session_state_to_context=True,
-        enable_agentic_state=True,
-        tools=[update_profile, update_multiple_fields, confirm_profile, check_profile_completeness],
-        instructions=[
-            "You are a personal Self Analysis Coach helping users explore their career path.",
-            "",
-            "GOAL: Collect these 5 pieces of information:",
-            "1. Name",
-            "2. Age",
-            "3. Current occupation or student status",
-            "4. Desired career path",
-            "5. Work experience or part-time job history",
-            "",
-            "CURRENT PROFILE STATUS:",
-            f"Name: {initial_profile.get('name', 'Not provided')}",
-            f"Age: {initial_profile.get('age', 'Not provided')}",
-            f"Current Occupation: {initial_profile.get('current_occupation', 'Not provided')}",
-            f"Desired Career: {initial_profile.get('desired_career', 'Not provided')}",
-            f"Work Experience: {initial_profile.get('work_experience', 'Not provided')}",
-            "",
-            "IMPORTANT CONVERSATION RULES:",
-            "",
-            "1. HANDLING MULTIPLE DATA AT ONCE:",
-            "   - If user provides multiple pieces of information in one response, extract ALL relevant data",
-            "   - Use update_multiple_fields tool to update several fields at once",
-            "   - Example: 'I'm John, 25, working as a developer' → update name, age, and occupation",
-            "",
-            "2. HANDLING VAGUE ANSWERS:",
-            "   - If answer is too vague, ask specific follow-up questions",
-            "   - Examples of vague answers: 'I work', 'I'm in tech', 'I study'",
-            "   - Ask for specifics: 'What's your specific role?', 'Which field of tech?', 'What do you study?'",
-            "",
-            "3. WORK EXPERIENCE HANDLING:",
-            "   - If user mentions current job, also ask about work experience duration",
-            "   - If they say 'working for 3 years', update both current_occupation AND work_experience",
-            "",
-            "4. CONFIRMATION PROCESS:",
-            "   - Use check_profile_completeness to see what's missing",
-            "   - Only use confirm_profile when ALL 5 fields are filled",
-            "   - Always show a summary before confirming",
-            "",
-            "5. GREETING BEHAVIOR:",
-            "   - If name provided: greet by name",
-            "   - If no name: ask for name first",
-            "   - Be warm and encouraging throughout",
-            "",
-            "EXAMPLE CONVERSATION FLOWS:",
-            "",
-            "User: 'Hi, I'm Sarah, 28, working as a software engineer for 5 years, want to become a tech lead'",
-            "→ Extract: name=Sarah, age=28, current_occupation=software engineer, work_experience=5 years, desired_career=tech lead",
-            "→ Use update_multiple_fields with all data",
-            "→ Confirm all information is correct",
-            "",
-            "User: 'I work in tech'",
-            "→ Too vague! Ask: 'What's your specific role in tech? Are you a developer, designer, analyst, etc.?'",
-            "",
-            "Always use the tools to update the session state as you collect information!"
-        ],
-        markdown=True
-    )
+    # Reuse the cached agent; only the session state is per-session.
+    coach_agent = _build_agent()
+    coach_agent.session_state = {
+        "user_profile": initial_profile,
+        "profile_confirmed": False
+    }
 
     print("🎯 Welcome to your Self Analysis Coaching Session!")
     print("Type 'exit' to end the session at any time.\n")
@@ -231,7 +356,8 @@ def run_coaching_session(name: Optional[str] = None, age: Optional[int] = None):
         print("Let's start by getting to know you better. What's your name?")
 
     while True:
-        user_input = input("\n👤 You: ").strip()
+        sys.stdout.flush()
+        user_input = input(_USER_PROMPT).strip()
 
         if user_input.lower() in ['exit', 'quit', 'bye']:
             print("\n🎯 Thank you for the coaching session! Take care!")
@@ -240,43 +366,70 @@ def run_coaching_session(name: Optional[str] = None, age: Optional[int] = None):
         if not user_input:
             continue
 
-        coach_agent.print_response(user_input, stream=True)
+        profile_snapshot = tuple(sorted(profile_memory.items()))
+        cache_key = (_DEFAULT_SESSION_ID, user_input.casefold(), profile_snapshot)
+        cached_reply = _reply_cache.get(cache_key)
+
+        if cached_reply is not None:
+            _reply_cache.move_to_end(cache_key)
+            print(cached_reply)
+        else:
+            # Stream and capture at the same time so a repeat of this exact
+            # turn can be answered without another model call.
+            reply_parts = []
+            for chunk in coach_agent.run(user_input, stream=True):
+                content = getattr(chunk, "content", None)
+                if content and isinstance(content, str):
+                    sys.stdout.write(content)
+                    sys.stdout.flush()
+                    reply_parts.append(content)
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+            reply = "".join(reply_parts)
+
+            # Cache only turns that left the profile untouched; a tool-driven
+            # state change means the same input would not replay the same way.
+            unchanged = profile_snapshot == tuple(sorted(profile_memory.items()))
+            if reply and unchanged:
+                _reply_cache[cache_key] = reply
+                while len(_reply_cache) > _REPLY_CACHE_CAP:
+                    _reply_cache.popitem(last=False)
 
         # Check if profile is complete
         current_state = coach_agent.get_session_state()
-        print(f"DEBUG: Session state after response: {current_state}")
+        log.debug("Session state after response: %s", current_state)
 
         if current_state and current_state.get('profile_confirmed', False):
             # Merge before final rendering to avoid empty outputs
             profile = _merge_profile(current_state)
-            print(f"DEBUG: Final profile data (merged): {profile}")
+            log.debug("Final profile data (merged): %s", profile)
 
             print("\n✅ All information collected successfully!")
             print("📊 Final Profile Summary:")
 
             # Display all collected information
-            profile_fields = [
-                ('Name', 'name'),
-                ('Age', 'age'),
-                ('Current Occupation', 'current_occupation'),
-                ('Desired Career', 'desired_career'),
-                ('Work Experience', 'work_experience')
-            ]
-
-            for display_name, field_key in profile_fields:
-                value = profile.get(field_key)
-                if value is not None and value != "":
-                    print(f"{display_name}: {value}")
-                    profile_data_to_store_to_db[display_name] = value
+            collected = {
+                display_name: profile[field_key]
+                for display_name, field_key in _PROFILE_DISPLAY
+                if _is_set(profile.get(field_key))
+            }
+            for display_name, value in collected.items():
+                print(f"{display_name}: {value}")
+            profile_data_to_store_to_db.update(collected)
 
 
             print(
                 "\n🎯 Thank you for sharing your information! In the next step, we will discuss your goals and aspirations in more detail.")
             break
 
+    # Release the in-process memory once the loop ends so the next session
+    # in this process starts clean.
+    profile_memory.clear()
+
 
 # Example usage scenarios
 if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
     # Test the scenario with comprehensive data handling
     print("=== Test: Comprehensive Data Handling ===")
     # run_coaching_session(name="John", age=30)
@@ -284,6 +437,9 @@ if __name__ == "__main__":
     # run_coaching_session(name="John")
     run_coaching_session()
 
+    print("*" * 50)
+    print("Profile Data", profile_data_to_store_to_db)
+
 """
 📊 Final Profile Summary:
 Name: John
@@ -291,8 +447,4 @@ Age: 30
 Current Occupation: engineer
 Desired Career: poetry
 Work Experience: 4 years
-"""
-
-
-print("*"*50)
-print("Profile Data", profile_data_to_store_to_db)
\ No newline at end of file
+"""
\ No newline at end of file